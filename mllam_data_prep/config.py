@@ -1,9 +1,18 @@
+import datetime
+import functools
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Union
 
 import dataclass_wizard
+import yaml
 from dataclass_wizard import JSONWizard
 
+# use the libyaml based loader when PyYAML has been built with it, since it is
+# much faster than the pure-python loader (and otherwise identical to `yaml.safe_load`)
+_yaml_load = functools.partial(
+    yaml.load, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+)
+
 
 class InvalidConfigException(Exception):
     pass
@@ -20,17 +29,22 @@ class Range:
     Attributes
     ----------
     start: str
-        The start of the range, e.g. "1990-09-03T00:00", 0, or 0.0.
+        The start of the range, e.g. "1990-09-03T00:00", 0, or 0.0. When
+        the config is given as a python dictionary this may also be a
+        `datetime.datetime` object.
     end: str
-        The end of the range, e.g. "1990-09-04T00:00", 1, or 1.0.
+        The end of the range, e.g. "1990-09-04T00:00", 1, or 1.0. When
+        the config is given as a python dictionary this may also be a
+        `datetime.datetime` object.
     step: str
         The step size for the range, e.g. "PT3H", 1, or 1.0. If not given
-        then the entire range will be selected.
+        then the entire range will be selected. When the config is given as a
+        python dictionary this may also be a `datetime.timedelta` object.
     """
 
-    start: Union[str, int, float]
-    end: Union[str, int, float]
-    step: Union[str, int, float] = None
+    start: Union[str, int, float, datetime.datetime]
+    end: Union[str, int, float, datetime.datetime]
+    step: Union[str, int, float, datetime.timedelta] = None
 
 
 @dataclass
@@ -301,6 +315,58 @@ class Config(dataclass_wizard.JSONWizard, dataclass_wizard.YAMLWizard):
     class _(JSONWizard.Meta):
         raise_on_unknown_json_key = True
 
+    @classmethod
+    def from_yaml(cls, string_or_stream, *, decoder=None, **decoder_kwargs):
+        """
+        Parse the config from a yaml string or stream (this is also used by
+        `Config.from_yaml_file`). Unless a `decoder` is given the yaml is parsed
+        with libyaml when available.
+        """
+        if decoder is None:
+            decoder = _yaml_load
+        return super().from_yaml(string_or_stream, decoder=decoder, **decoder_kwargs)
+
+
+def validate_config(config: Config):
+    """
+    Check the config for inconsistencies that can be found without opening
+    any of the input datasets, so that these are caught before any data is
+    loaded.
+
+    Currently this checks that variables being stacked into a feature
+    dimension (with the `stack_variables_by_var_name` method) for one output
+    variable are not stacked into a dimension with the same name for another
+    output variable. Feature dimensions shared between output variables are
+    always rejected, even if the same variables are stacked with the same
+    `name_format`: the `{feature_dim}_source_dataset` coordinate records
+    the name of the input dataset each feature comes from, and this always
+    differs between output variables, so these could never be merged.
+
+    Parameters
+    ----------
+    config : Config
+        The config to validate
+
+    Raises
+    ------
+    InvalidConfigException
+        If the config is invalid
+    """
+    target_by_feature_dim = {}
+    for dataset_name, input_config in config.inputs.items():
+        target = input_config.target_output_variable
+        for output_dim, dim_mapping in input_config.dim_mapping.items():
+            if dim_mapping.method != "stack_variables_by_var_name":
+                continue
+            other_target = target_by_feature_dim.setdefault(output_dim, target)
+            if other_target != target:
+                raise InvalidConfigException(
+                    f"The variables of input dataset `{dataset_name}` are stacked into the"
+                    f" dimension `{output_dim}` for output variable `{target}`, but this"
+                    f" dimension is also used for the output variable `{other_target}`."
+                    " Please give the feature dimension a unique name for each output variable."
+                )
+
 
 if __name__ == "__main__":
     import argparse
@@ -9,7 +9,7 @@ from loguru import logger
 from numcodecs import Blosc
 
 from . import __version__
-from .config import Config, InvalidConfigException
+from .config import Config, InvalidConfigException, validate_config
 from .ops.loading import load_and_subset_dataset
 from .ops.mapping import map_dims_and_variables
 from .ops.selection import select_by_kwargs
@@ -118,6 +118,8 @@ def create_dataset(config: Config):
             "update the schema version used in your config to v0.5.0."
         )
 
+    validate_config(config)
+
     output_config = config.output
     output_coord_ranges = output_config.coord_ranges
 
@@ -157,6 +159,25 @@ def create_dataset(config: Config):
                 " using the 'dim_mapping' key in the input dataset"
             )
 
+        # coordinate ranges for output dimensions that are simply renamed from
+        # an input dimension are selected on before the dimensions and
+        # variables are mapped, so that an invalid selection (e.g. a time range
+        # not covered by the input) is caught before any stacking is done and
+        # so that only the selected data is carried through the mapping
+        selection_kwargs_before_mapping = {}
+        selection_kwargs_after_mapping = {}
+        if output_coord_ranges is not None:
+            for dim in output_dims:
+                if dim not in output_coord_ranges:
+                    continue
+                coord_range = output_coord_ranges[dim]
+                if dim_mapping[dim].method == "rename":
+                    selection_kwargs_before_mapping[dim_mapping[dim].dim] = coord_range
+                else:
+                    selection_kwargs_after_mapping[dim] = coord_range
+
+        ds = select_by_kwargs(ds, **selection_kwargs_before_mapping)
+
         logger.info(
             f"Mapping dimensions and variables for dataset {dataset_name} to {target_output_var}"
         )
@@ -175,12 +196,7 @@ def create_dataset(config: Config):
         da_target.attrs["source_dataset"] = dataset_name
 
         # only need to do selection for the coordinates that the input dataset actually has
-        if output_coord_ranges is not None:
-            selection_kwargs = {}
-            for dim in output_dims:
-                if dim in output_coord_ranges:
-                    selection_kwargs[dim] = output_coord_ranges[dim]
-            da_target = select_by_kwargs(da_target, **selection_kwargs)
+        da_target = select_by_kwargs(da_target, **selection_kwargs_after_mapping)
 
         dataarrays_by_target[target_output_var].append(da_target)
 
@@ -242,39 +258,84 @@ def create_dataset(config: Config):
     return ds
 
 
-def create_dataset_zarr(fp_config, fp_zarr: str = None):
+def _load_config(fp_config=None, config_dict=None):
+    """
+    Load the config either from a yaml file (given as a path or an open
+    file-like object) or from a dictionary. Exactly one of `fp_config` and
+    `config_dict` must be given.
+    """
+    if (fp_config is None) == (config_dict is None):
+        raise ValueError("Exactly one of `fp_config` and `config_dict` must be given")
+
+    if config_dict is not None:
+        return Config.from_dict(config_dict)
+    elif hasattr(fp_config, "read"):
+        return Config.from_yaml(fp_config)
+    else:
+        return Config.from_yaml_file(file=fp_config)
+
+
+def create_dataset_zarr(
+    fp_config=None, fp_zarr: str = None, config_dict: dict = None, store=None
+):
     """
     Create a dataset from the input datasets specified in the config file and write it to a zarr file.
     The path to the zarr file is the same as the config file, but with the extension changed to '.zarr'.
 
     Parameters
     ----------
-    fp_config : Path
-        The path to the configuration file.
+    fp_config : Path or file-like, optional
+        The path to the configuration file, or an open file-like object
+        (text or binary) to read the yaml configuration from.
     fp_zarr : Path, optional
         The path to the zarr file to write the dataset to. If not provided, the zarr file will be written
         to the same directory as the config file with the extension changed to '.zarr'.
+    config_dict : dict, optional
+        The configuration given as a dictionary with the same structure as the
+        config file. This can be used instead of `fp_config` to skip writing
+        the config to disk and parsing it back.
+    store : MutableMapping, optional
+        The zarr store to write the dataset to instead of writing to `fp_zarr`,
+        e.g. a `zarr.storage.MemoryStore` to keep the dataset in memory.
+
+    When the config isn't read from a path (i.e. it is given as a file-like
+    object or with `config_dict`) then either `fp_zarr` or `store` must be provided.
     """
-    config = Config.from_yaml_file(file=fp_config)
+    if store is not None and fp_zarr is not None:
+        raise ValueError("Only one of `fp_zarr` and `store` can be given")
+
+    if (
+        fp_zarr is None
+        and store is None
+        and (config_dict is not None or hasattr(fp_config, "read"))
+    ):
+        raise ValueError(
+            "`fp_zarr` or `store` must be given when the config isn't read from a file path"
+        )
+
+    config = _load_config(fp_config=fp_config, config_dict=config_dict)
 
     ds = create_dataset(config=config)
 
     logger.info("Writing dataset to zarr")
-    if fp_zarr is None:
-        fp_zarr = fp_config.parent / fp_config.name.replace(".yaml", ".zarr")
-    else:
-        fp_zarr = Path(fp_zarr)
+    if store is None:
+        if fp_zarr is None:
+            fp_zarr = fp_config.parent / fp_config.name.replace(".yaml", ".zarr")
+        else:
+            fp_zarr = Path(fp_zarr)
+
+        if fp_zarr.exists():
+            logger.info(f"Removing existing dataset at {fp_zarr}")
+            shutil.rmtree(fp_zarr)
 
-    if fp_zarr.exists():
-        logger.info(f"Removing existing dataset at {fp_zarr}")
-        shutil.rmtree(fp_zarr)
+        store = fp_zarr
 
     # use zstd compression since it has a good balance of speed and compression ratio
     # https://engineering.fb.com/2016/08/31/core-infra/smaller-and-faster-data-compression-with-zstandard/
     compressor = Blosc(cname="zstd", clevel=1, shuffle=Blosc.BITSHUFFLE)
     encoding = {v: {"compressor": compressor} for v in ds.data_vars}
 
-    ds.to_zarr(fp_zarr, consolidated=True, mode="w", encoding=encoding)
-    logger.info(f"Wrote training-ready dataset to {fp_zarr}")
+    ds.to_zarr(store, consolidated=True, mode="w", encoding=encoding)
+    logger.info(f"Wrote training-ready dataset to {store}")
 
     logger.info(ds)
@@ -99,8 +99,10 @@ def map_dims_and_variables(ds, dim_mapping, expected_input_var_dims):
             # when stacking we assume that the input_dims is a list of dimensions
             # in the input dataset that we want to stack to create the architecture
             # dimension, this is for example used for flatting the spatial dimensions
-            # into a single dimension representing the grid index
-            ds = ds.stack({arch_dim: source_dims}).reset_index(arch_dim)
+            # into a single dimension representing the grid index. The
+            # stacked source coordinates are kept as plain coordinates along
+            # the new dimension, so we skip building a pandas.MultiIndex
+            ds = ds.stack({arch_dim: source_dims}, create_index=False)
         else:
             raise NotImplementedError(method)
 
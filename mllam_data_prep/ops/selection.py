@@ -8,6 +8,8 @@ from ..config import Range
 def _normalize_slice_startstop(s):
     if isinstance(s, pd.Timestamp):
         return s
+    elif isinstance(s, datetime.datetime):
+        return pd.Timestamp(s)
     elif isinstance(s, str):
         try:
             return pd.Timestamp(s)
@@ -20,6 +22,8 @@ def _normalize_slice_startstop(s):
 def _normalize_slice_step(s):
     if isinstance(s, pd.Timedelta):
         return s
+    elif isinstance(s, datetime.timedelta):
+        return pd.Timedelta(s)
     elif isinstance(s, str):
         try:
             return pd.to_timedelta(s)
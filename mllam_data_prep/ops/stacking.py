@@ -1,3 +1,4 @@
+import numpy as np
 import xarray as xr
 
 
@@ -62,12 +63,14 @@ def stack_variables_by_coord_values(ds, coord, name_format, combined_dim_name):
     "{var_name}_l{level}"
 
     This is implemented by:
-    1. iterating over all variables in the dataset
-    2. for each variable, we create a new set of coordinate values which
-       include the variable name and the coordinate values, and rename the
-       coordinate to the `combined_dim_name`
-    3. stack all the variables along the `combined_dim_name` dimension to
-       produce a single xr.DataArray
+    1. concatenating the data of all variables along the `coord` axis, so
+       that the values of `coord` for each variable follow each other. This
+       is done directly on the underlying arrays (so the data is not loaded
+       if it is a dask array) rather than through `xr.concat`
+    2. creating the new coordinate values (which include the variable name
+       and the coordinate values) for the `combined_dim_name` dimension
+    3. concatenating any other coordinates along `coord` in the same way as
+       the data, so that they span the `combined_dim_name` dimension
 
     In addition to the stacked variables, we also add extra coordinates for
     keeping track of `units` and `long_name` attributes for each variable in
@@ -106,27 +109,64 @@ def stack_variables_by_coord_values(ds, coord, name_format, combined_dim_name):
             f"The coordinate {coord} is not in the dataset, found coords: {list(ds.coords)}"
         )
 
-    datasets = []
-    for var_name in list(ds.data_vars):
-        da = ds[var_name]
-        coord_values = da.coords[coord].values
-        new_coord_values = [
-            name_format.format(var_name=var_name, **{coord: val})
-            for val in coord_values
-        ]
-        da = da.assign_coords({coord: new_coord_values}).rename(
-            {coord: combined_dim_name}
+    var_names = list(ds.data_vars)
+    # look up each variable only once, this is used for both the data and the
+    # attributes below
+    dataarrays = [ds[var_name] for var_name in var_names]
+    da_first = dataarrays[0]
+    dims = da_first.dims
+    axis = dims.index(coord)
+
+    if len(dataarrays) == 1:
+        # nothing to concatenate with, so the data can be used as-is (without
+        # making a copy) and only the coordinate values need to be changed
+        data = da_first.data
+    else:
+        data = np.concatenate(
+            [da.transpose(*dims).data for da in dataarrays], axis=axis
         )
 
-        # add extra coordinates for keeping track of `units` and `long_name` attributes
-        for attr in ["units", "long_name"]:
-            da_attr = xr.DataArray(
-                [ds[var_name].attrs.get(attr, "")] * len(coord_values),
-                dims=[combined_dim_name],
+    coord_values = ds[coord].values
+    new_coord_values = [
+        name_format.format(var_name=var_name, **{coord: val})
+        for var_name in var_names
+        for val in coord_values
+    ]
+    coords = {}
+    for name, da_coord in da_first.coords.items():
+        if name == coord:
+            continue
+        elif coord not in da_coord.dims:
+            coords[name] = da_coord
+        else:
+            # auxiliary coordinates along `coord` (e.g. the height of each
+            # level) are concatenated for all variables in the same way as the
+            # data, so that they span the `combined_dim_name` dimension
+            coord_dims = da_coord.dims
+            coord_data = np.concatenate(
+                [da.coords[name].transpose(*coord_dims).data for da in dataarrays],
+                axis=coord_dims.index(coord),
             )
-            da.coords[f"{combined_dim_name}_{attr}"] = da_attr
-        datasets.append(da)
+            coords[name] = (
+                tuple(combined_dim_name if d == coord else d for d in coord_dims),
+                coord_data,
+                da_coord.attrs,
+            )
+    coords[combined_dim_name] = new_coord_values
+
+    # add extra coordinates for keeping track of `units` and `long_name` attributes
+    for attr in ["units", "long_name"]:
+        coords[f"{combined_dim_name}_{attr}"] = (
+            combined_dim_name,
+            [da.attrs.get(attr, "") for da in dataarrays for _ in coord_values],
+        )
 
-    da_combined = xr.concat(datasets, dim=combined_dim_name)
+    da_combined = xr.DataArray(
+        data,
+        dims=dims[:axis] + (combined_dim_name,) + dims[axis + 1 :],
+        coords=coords,
+        name=da_first.name,
+        attrs=da_first.attrs,
+    )
 
     return da_combined
@@ -0,0 +1,30 @@
+import pytest
+
+import tests.data as testdata
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--mdp-cache",
+        action="store_true",
+        default=False,
+        help=(
+            "Reuse the dataset created from `example.danra.yaml` between test runs."
+            " The dataset is cached in the system temporary directory keyed by the"
+            " content of the config file and the source code of mllam-data-prep,"
+            " so that it is recreated when either changes"
+        ),
+    )
+
+
+@pytest.fixture(scope="session")
+def datasets(tmp_path_factory):
+    """
+    Fake data collection with all the kinds of test data, created once per
+    test session and shared (read-only) between the tests. Returns a dict with
+    the path to the dataset for each data kind
+    """
+    fp_root = tmp_path_factory.mktemp("data")
+    return testdata.create_data_collection(
+        data_kinds=testdata.ALL_DATA_KINDS, fp_root=str(fp_root)
+    )
@@ -15,6 +15,11 @@ DT_FORECAST = isodate.parse_duration("PT1H")
 T_START = isodate.parse_datetime("2000-01-01T00:00")
 T_END_ANALYSIS = T_START + (NT_ANALYSIS - 1) * DT_ANALYSIS
 T_END_FORECAST = T_START + (NT_FORECAST - 1) * DT_FORECAST
+# seeded generator for the random test data, so that the same datasets are
+# created on every run
+_RNG = np.random.default_rng(0)
+# the values of the test data aren't checked, so single precision is enough
+_DTYPE = np.float32
 DEFAULT_FORECAST_VARS = ["u", "v", "t", "precip"]
 DEFAULT_ATMOSPHERIC_ANALYSIS_VARS = ["u", "v", "t"]
 DEFAULT_SURFACE_ANALYSIS_VARS = [
@@ -50,7 +55,7 @@ def create_surface_forecast_dataset(
     dataarrays = {}
     for var_name in var_names:
         da = xr.DataArray(
-            np.random.random((nt_analysis, nt_forecast, nx, ny)),
+            _RNG.random((nt_analysis, nt_forecast, nx, ny), dtype=_DTYPE),
             dims=["analysis_time", "forecast_time", "x", "y"],
             coords={
                 "analysis_time": ts_analysis,
@@ -82,7 +87,7 @@ def create_surface_analysis_dataset(
     dataarrays = {}
     for var_name in var_names:
         da = xr.DataArray(
-            np.random.random((nt_analysis, nx, ny)),
+            _RNG.random((nt_analysis, nx, ny), dtype=_DTYPE),
             dims=["analysis_time", "x", "y"],
             coords={
                 "analysis_time": ts_analysis,
@@ -132,7 +137,7 @@ def create_analysis_dataset_on_levels(
     dataarrays = {}
     for var_name in var_names:
         da = xr.DataArray(
-            np.random.random((nt_analysis, nz, nx, ny)),
+            _RNG.random((nt_analysis, nz, nx, ny), dtype=_DTYPE),
             dims=["analysis_time", level_dim, "x", "y"],
             coords={
                 "analysis_time": ts_analysis,
@@ -191,7 +196,7 @@ def create_forecast_dataset_on_levels(
     dataarrays = {}
     for var_name in var_names:
         da = xr.DataArray(
-            np.random.random((nt_analysis, nt_forecast, nz, nx, ny)),
+            _RNG.random((nt_analysis, nt_forecast, nz, nx, ny), dtype=_DTYPE),
             dims=["analysis_time", "forecast_time", level_dim, "x", "y"],
             coords={
                 "analysis_time": ts_analysis,
@@ -217,7 +222,7 @@ def create_static_dataset(nx, ny, var_names=DEFAULT_STATIC_VARS):
     dataarrays = {}
     for var_name in var_names:
         da = xr.DataArray(
-            np.random.random((nx, ny)),
+            _RNG.random((nx, ny), dtype=_DTYPE),
             dims=["x", "y"],
             coords={
                 "x": x,
@@ -275,7 +280,15 @@ def create_data_collection(data_kinds, fp_root):
         dataset_name = f"{data_kind}_{identifier}"
 
         fp = f"{fp_root}/{dataset_name}.zarr"
-        ds.to_zarr(fp, mode="w")
+        # the test datasets are small, so store each variable uncompressed in
+        # a single chunk
+        encoding = {
+            var_name: dict(compressor=None, chunks=ds[var_name].shape)
+            for var_name in ds.data_vars
+        }
+        # write consolidated metadata so that opening the dataset only needs
+        # to read the single `.zmetadata` file
+        ds.to_zarr(fp, mode="w", consolidated=True, encoding=encoding)
         datasets[data_kind] = fp
 
     return datasets
@@ -1,7 +1,9 @@
 import pytest
+import yaml
 from dataclass_wizard.errors import MissingFields, UnknownJSONKey
 
 import mllam_data_prep as mdp
+from mllam_data_prep.config import validate_config
 
 INVALID_EXTRA_FIELDS_CONFIG_YAML = """
 schema_version: v0.1.0
@@ -119,3 +121,71 @@ def test_get_config_nested():
         assert input_config.target_output_variable is not None
         with pytest.raises(AttributeError):
             input_config.foobarfield
+
+
+def test_config_yaml_loader_matches_safe_load():
+    """
+    The config is parsed with libyaml (when available) by default, check that
+    this gives the same result as parsing with `yaml.safe_load`
+    """
+    config = mdp.Config.from_yaml(VALID_EXAMPLE_CONFIG_YAML)
+    config_safe_load = mdp.Config.from_yaml(
+        VALID_EXAMPLE_CONFIG_YAML, decoder=yaml.safe_load
+    )
+    assert config == config_safe_load
+
+
+def _make_stacked_input(target_output_variable, feature_dim):
+    """
+    Input dataset config with the variables stacked into `feature_dim`, the
+    dataset isn't opened when only validating the config
+    """
+    return dict(
+        path="static.zarr",
+        dims=["x", "y"],
+        variables=["lsm", "orography"],
+        dim_mapping={
+            "grid_index": dict(method="stack", dims=["x", "y"]),
+            feature_dim: dict(
+                method="stack_variables_by_var_name", name_format="{var_name}"
+            ),
+        },
+        target_output_variable=target_output_variable,
+    )
+
+
+@pytest.mark.parametrize("use_common_feature_var_name", [True, False])
+def test_validate_config_feature_collision(use_common_feature_var_name):
+    """
+    Check that stacking variables into feature dimensions with the same name
+    for two output variables is rejected without opening any input datasets,
+    even when the same variables are stacked (since the features would come
+    from different input datasets)
+    """
+    if use_common_feature_var_name:
+        feature_dims = dict(static="feature", forcing="feature")
+    else:
+        feature_dims = dict(static="static_feature", forcing="forcing_feature")
+
+    config = mdp.Config.from_dict(
+        dict(
+            schema_version="v0.5.0",
+            dataset_version="v0.1.0",
+            output=dict(
+                variables={
+                    target: ["grid_index", feature_dim]
+                    for target, feature_dim in feature_dims.items()
+                }
+            ),
+            inputs={
+                f"danra_{target}": _make_stacked_input(target, feature_dim)
+                for target, feature_dim in feature_dims.items()
+            },
+        )
+    )
+
+    if use_common_feature_var_name:
+        with pytest.raises(mdp.InvalidConfigException):
+            validate_config(config)
+    else:
+        validate_config(config)
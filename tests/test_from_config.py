@@ -1,134 +1,180 @@
-import shutil
+import hashlib
+import io
 import tempfile
+from collections.abc import Mapping
 from pathlib import Path
+from types import MappingProxyType
 
 import isodate
 import pytest
+import xarray as xr
 import yaml
+import zarr
 
 import mllam_data_prep as mdp
 import tests.data as testdata
+from mllam_data_prep.config import validate_config
+from mllam_data_prep.create_dataset import _merge_dataarrays_by_target
 
+# use the libyaml emitter when PyYAML has been built with it
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
 
-def test_gen_data():
-    tmpdir = tempfile.TemporaryDirectory()
-    testdata.create_data_collection(
-        data_kinds=testdata.ALL_DATA_KINDS, fp_root=tmpdir.name
+_T_START_ISO = testdata.T_START.isoformat()
+_T_END_ISO = testdata.T_END_ANALYSIS.isoformat()
+_DT_ISO = isodate.duration_isoformat(testdata.DT_ANALYSIS)
+
+_TIME_STEPSIZES = (
+    testdata.DT_ANALYSIS,
+    testdata.DT_ANALYSIS * 2,
+    testdata.DT_ANALYSIS / 2,
+)
+
+# read-only mappings shared between the input sections used in the tests
+# below. These can be passed to `mdp.create_dataset_zarr(config_dict=...)`
+# as-is, but must be converted with `_to_plain` before `yaml.dump`
+_RENAME_ANALYSIS_TIME = MappingProxyType(dict(method="rename", dim="analysis_time"))
+_STACK_XY = MappingProxyType(dict(method="stack", dims=("x", "y")))
+_STACK_VARIABLES_BY_VAR_NAME = MappingProxyType(
+    dict(method="stack_variables_by_var_name", name_format="{var_name}")
+)
+
+# skeletons for the input sections used in the tests below, each test
+# creates a copy of these (with `_make_input_config`) and only sets the fields
+# that differ between tests
+_BASE_INPUT_SURFACE = MappingProxyType(
+    dict(
+        dims=("analysis_time", "x", "y"),
+        variables=list(testdata.DEFAULT_SURFACE_ANALYSIS_VARS),
+        dim_mapping=MappingProxyType(
+            dict(time=_RENAME_ANALYSIS_TIME, grid_index=_STACK_XY)
+        ),
+    )
+)
+
+_BASE_INPUT_STATIC = MappingProxyType(
+    dict(
+        dims=("x", "y"),
+        variables=list(testdata.DEFAULT_STATIC_VARS),
+        dim_mapping=MappingProxyType(dict(grid_index=_STACK_XY)),
     )
+)
 
 
-def test_merging_static_and_surface_analysis():
-    tmpdir = tempfile.TemporaryDirectory()
-    datasets = testdata.create_data_collection(
-        data_kinds=["surface_analysis", "static"], fp_root=tmpdir.name
+def _make_input_config(base, path, target_output_variable, feature_dim):
+    """
+    Create an input dataset config from one of the `_BASE_INPUT_*` templates
+    with the variables stacked into `feature_dim` by variable name. The
+    top-level dict, `variables` and `dim_mapping` are copied, the read-only
+    sub-mappings are shared with the template.
+    """
+    return dict(
+        base,
+        path=path,
+        variables=list(base["variables"]),
+        target_output_variable=target_output_variable,
+        dim_mapping={**base["dim_mapping"], feature_dim: _STACK_VARIABLES_BY_VAR_NAME},
     )
 
+
+def _make_config(inputs, **output):
+    """
+    Create a config with the current schema version from the `inputs` section
+    and the entries of the `output` section
+    """
+    return dict(
+        schema_version=testdata.SCHEMA_VERSION,
+        dataset_version="v0.1.0",
+        output=output,
+        inputs=inputs,
+    )
+
+
+def _to_plain(obj):
+    """
+    Recursively convert the (read-only) mappings and tuples of a config into
+    plain dicts and lists, so that it can be serialised with `yaml.dump`
+    """
+    if isinstance(obj, Mapping):
+        return {k: _to_plain(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_to_plain(v) for v in obj]
+    return obj
+
+
+def test_gen_data(datasets):
+    assert set(datasets.keys()) == set(testdata.ALL_DATA_KINDS)
+    for fp in datasets.values():
+        xr.open_zarr(fp)
+
+
+@pytest.mark.e2e
+def test_merging_static_and_surface_analysis(datasets):
     # use 80% for training and 20% for testing
-    t_train_start = testdata.T_START
     t_train_end = testdata.T_START + 0.8 * (testdata.T_END_ANALYSIS - testdata.T_START)
     t_test_start = t_train_end + testdata.DT_ANALYSIS
-    t_test_end = testdata.T_END_ANALYSIS
 
-    config = dict(
-        schema_version=testdata.SCHEMA_VERSION,
-        dataset_version="v0.1.0",
-        output=dict(
-            variables=dict(
-                static=["grid_index", "static_feature"],
-                state=["time", "grid_index", "state_feature"],
-                forcing=["time", "grid_index", "forcing_feature"],
-            ),
-            coord_ranges=dict(
-                time=dict(
-                    start=testdata.T_START.isoformat(),
-                    end=testdata.T_END_ANALYSIS.isoformat(),
-                    step=isodate.duration_isoformat(testdata.DT_ANALYSIS),
-                )
-            ),
-            splitting=dict(
-                dim="time",
-                splits=dict(
-                    train=dict(
-                        start=t_train_start.isoformat(),
-                        end=t_train_end.isoformat(),
-                        compute_statistics=dict(
-                            ops=["mean", "std"],
-                            dims=["time", "grid_index"],
-                        ),
-                    ),
-                    test=dict(
-                        start=t_test_start.isoformat(),
-                        end=t_test_end.isoformat(),
-                    ),
-                ),
-            ),
-        ),
+    config = _make_config(
         inputs=dict(
-            danra_surface=dict(
+            danra_surface=_make_input_config(
+                _BASE_INPUT_SURFACE,
                 path=datasets["surface_analysis"],
-                dims=["analysis_time", "x", "y"],
-                variables=testdata.DEFAULT_SURFACE_ANALYSIS_VARS,
-                dim_mapping=dict(
-                    time=dict(
-                        method="rename",
-                        dim="analysis_time",
-                    ),
-                    grid_index=dict(
-                        method="stack",
-                        dims=["x", "y"],
-                    ),
-                    forcing_feature=dict(
-                        method="stack_variables_by_var_name",
-                        name_format="{var_name}",
-                    ),
-                ),
                 target_output_variable="forcing",
+                feature_dim="forcing_feature",
             ),
-            danra_static=dict(
+            danra_static=_make_input_config(
+                _BASE_INPUT_STATIC,
                 path=datasets["static"],
-                dims=["x", "y"],
-                variables=testdata.DEFAULT_STATIC_VARS,
-                dim_mapping=dict(
-                    grid_index=dict(
-                        method="stack",
-                        dims=["x", "y"],
-                    ),
-                    static_feature=dict(
-                        method="stack_variables_by_var_name",
-                        name_format="{var_name}",
+                target_output_variable="static",
+                feature_dim="static_feature",
+            ),
+        ),
+        variables=dict(
+            static=["grid_index", "static_feature"],
+            state=["time", "grid_index", "state_feature"],
+            forcing=["time", "grid_index", "forcing_feature"],
+        ),
+        coord_ranges=dict(
+            time=dict(
+                start=_T_START_ISO,
+                end=_T_END_ISO,
+                step=_DT_ISO,
+            )
+        ),
+        splitting=dict(
+            dim="time",
+            splits=dict(
+                train=dict(
+                    start=_T_START_ISO,
+                    end=t_train_end.isoformat(),
+                    compute_statistics=dict(
+                        ops=["mean", "std"],
+                        dims=["time", "grid_index"],
                     ),
                 ),
-                target_output_variable="static",
+                test=dict(
+                    start=t_test_start.isoformat(),
+                    end=_T_END_ISO,
+                ),
             ),
         ),
     )
 
-    # write yaml config to file
-    fn_config = "config.yaml"
-    fp_config = Path(tmpdir.name) / fn_config
-    with open(fp_config, "w") as f:
-        yaml.dump(config, f)
+    store = zarr.storage.MemoryStore()
+    mdp.create_dataset_zarr(config_dict=config, store=store)
 
-    mdp.create_dataset_zarr(fp_config=fp_config)
+    ds = xr.open_zarr(store)
+    assert {"static", "forcing", "splits"}.issubset(ds.data_vars)
 
 
+@pytest.mark.e2e
 @pytest.mark.parametrize("source_data_contains_time_range", [True, False])
-@pytest.mark.parametrize(
-    "time_stepsize",
-    [testdata.DT_ANALYSIS, testdata.DT_ANALYSIS * 2, testdata.DT_ANALYSIS / 2],
-)
-def test_time_selection(source_data_contains_time_range, time_stepsize):
+@pytest.mark.parametrize("time_stepsize", _TIME_STEPSIZES)
+def test_time_selection(datasets, source_data_contains_time_range, time_stepsize):
     """
     Check that time selection works as expected, so that when source
     data doesn't contain the time range specified in the config and exception
     is raised, and otherwise that the correct timesteps are in the output
     """
-
-    tmpdir = tempfile.TemporaryDirectory()
-    datasets = testdata.create_data_collection(
-        data_kinds=["surface_analysis", "static"], fp_root=tmpdir.name
-    )
-
     t_start_dataset = testdata.T_START
     t_end_dataset = t_start_dataset + (testdata.NT_ANALYSIS - 1) * testdata.DT_ANALYSIS
 
@@ -139,200 +185,222 @@ def test_time_selection(source_data_contains_time_range, time_stepsize):
         t_start_config = t_start_dataset - testdata.DT_ANALYSIS
         t_end_config = t_end_dataset + testdata.DT_ANALYSIS
 
-    config = dict(
-        schema_version=testdata.SCHEMA_VERSION,
-        dataset_version="v0.1.0",
-        output=dict(
-            variables=dict(
-                static=["grid_index", "feature"],
-                state=["time", "grid_index", "feature"],
-                forcing=["time", "grid_index", "feature"],
-            ),
-            coord_ranges=dict(
-                time=dict(
-                    start=t_start_config.isoformat(),
-                    end=t_end_config.isoformat(),
-                    step=isodate.duration_isoformat(time_stepsize),
-                )
-            ),
-        ),
+    config = _make_config(
         inputs=dict(
-            danra_surface=dict(
+            danra_surface=_make_input_config(
+                _BASE_INPUT_SURFACE,
                 path=datasets["surface_analysis"],
-                dims=["analysis_time", "x", "y"],
-                variables=testdata.DEFAULT_SURFACE_ANALYSIS_VARS,
-                dim_mapping=dict(
-                    time=dict(
-                        method="rename",
-                        dim="analysis_time",
-                    ),
-                    grid_index=dict(
-                        method="stack",
-                        dims=["x", "y"],
-                    ),
-                    feature=dict(
-                        method="stack_variables_by_var_name",
-                        name_format="{var_name}",
-                    ),
-                ),
                 target_output_variable="forcing",
+                feature_dim="feature",
             ),
         ),
+        variables=dict(
+            static=["grid_index", "feature"],
+            state=["time", "grid_index", "feature"],
+            forcing=["time", "grid_index", "feature"],
+        ),
+        coord_ranges=dict(
+            time=dict(
+                start=t_start_config,
+                end=t_end_config,
+                step=time_stepsize,
+            )
+        ),
     )
 
-    # write yaml config to file
-    fn_config = "config.yaml"
-    fp_config = Path(tmpdir.name) / fn_config
-    with open(fp_config, "w") as f:
-        yaml.dump(config, f)
+    config = mdp.Config.from_dict(config)
 
-    # run the main function
+    # nothing is read back from the output, so create the dataset without
+    # writing it to zarr
     if source_data_contains_time_range and time_stepsize == testdata.DT_ANALYSIS:
-        mdp.create_dataset_zarr(fp_config=fp_config)
+        ds = mdp.create_dataset(config=config)
+        assert ds.sizes["time"] == testdata.NT_ANALYSIS
     else:
         print(
             f"Expecting ValueError for source_data_contains_time_range={source_data_contains_time_range} and time_stepsize={time_stepsize}"
         )
         with pytest.raises(ValueError):
-            mdp.create_dataset_zarr(fp_config=fp_config)
+            mdp.create_dataset(config=config)
 
 
+@pytest.mark.e2e
 @pytest.mark.parametrize("use_common_feature_var_name", [True, False])
-def test_feature_collision(use_common_feature_var_name):
+def test_feature_collision(datasets, use_common_feature_var_name):
     """
     Use to arch target_output_variable variables which have a different number of features and
     therefore need a unique feature dimension for each target_output_variable. This should raise
-    a ValueError if the feature coordinates have the same name
+    an InvalidConfigException if the feature coordinates have the same name, which
+    `validate_config` catches from the config alone (before any data is loaded)
     """
-    tmpdir = tempfile.TemporaryDirectory()
-    datasets = testdata.create_data_collection(
-        data_kinds=["surface_analysis", "static"], fp_root=tmpdir.name
-    )
-
     if use_common_feature_var_name:
         static_feature_var_name = state_feature_var_name = "feature"
     else:
         static_feature_var_name = "static_feature"
         state_feature_var_name = "state_feature"
 
-    config = dict(
-        schema_version=testdata.SCHEMA_VERSION,
-        dataset_version="v0.1.0",
-        output=dict(
-            variables=dict(
-                static=["grid_index", static_feature_var_name],
-                state=["time", "grid_index", state_feature_var_name],
-            ),
-        ),
+    config = _make_config(
         inputs=dict(
-            danra_surface=dict(
+            danra_surface=_make_input_config(
+                _BASE_INPUT_SURFACE,
                 path=datasets["surface_analysis"],
-                dims=["analysis_time", "x", "y"],
-                variables=testdata.DEFAULT_SURFACE_ANALYSIS_VARS,
-                dim_mapping={
-                    "time": dict(
-                        method="rename",
-                        dim="analysis_time",
-                    ),
-                    "grid_index": dict(
-                        method="stack",
-                        dims=["x", "y"],
-                    ),
-                    state_feature_var_name: dict(
-                        method="stack_variables_by_var_name",
-                        name_format="{var_name}",
-                    ),
-                },
                 target_output_variable="state",
+                feature_dim=state_feature_var_name,
             ),
-            danra_static=dict(
+            danra_static=_make_input_config(
+                _BASE_INPUT_STATIC,
                 path=datasets["static"],
-                dims=["x", "y"],
-                variables=testdata.DEFAULT_STATIC_VARS,
-                dim_mapping={
-                    "grid_index": dict(
-                        dims=["x", "y"],
-                        method="stack",
-                    ),
-                    static_feature_var_name: dict(
-                        method="stack_variables_by_var_name",
-                        name_format="{var_name}",
-                    ),
-                },
                 target_output_variable="static",
+                feature_dim=static_feature_var_name,
             ),
         ),
+        variables=dict(
+            static=["grid_index", static_feature_var_name],
+            state=["time", "grid_index", state_feature_var_name],
+        ),
     )
 
-    # write yaml config to file
-    fn_config = "config.yaml"
-    fp_config = Path(tmpdir.name) / fn_config
-    with open(fp_config, "w") as f:
-        yaml.dump(config, f)
+    config = mdp.Config.from_dict(config)
 
     if use_common_feature_var_name:
         with pytest.raises(mdp.InvalidConfigException):
-            mdp.create_dataset_zarr(fp_config=fp_config)
+            validate_config(config)
+        with pytest.raises(mdp.InvalidConfigException):
+            mdp.create_dataset(config=config)
     else:
-        mdp.create_dataset_zarr(fp_config=fp_config)
+        validate_config(config)
+        mdp.create_dataset(config=config)
 
 
-def test_danra_example():
-    fp_config = Path(__file__).parent.parent / "example.danra.yaml"
-    with tempfile.TemporaryDirectory(suffix=".zarr") as tmpdir:
-        mdp.create_dataset_zarr(fp_config=fp_config, fp_zarr=tmpdir)
+def test_merge_feature_collision():
+    """
+    Check that merging dataarrays for different target variables which share
+    a feature dimension with different coordinate values raises an
+    InvalidConfigException. This is the fallback for collisions that
+    `validate_config` can't catch from the config alone
+    """
+    dataarrays_by_target = {}
+    for target, features in [("static", ["lsm"]), ("state", ["u", "v"])]:
+        da = xr.DataArray(
+            [[0.0] * len(features)] * testdata.NX,
+            dims=["grid_index", "feature"],
+            coords={"feature": features},
+            attrs=dict(variables_mapping_dim="feature", source_dataset=target),
+        )
+        dataarrays_by_target[target] = [da]
+
+    with pytest.raises(mdp.InvalidConfigException):
+        _merge_dataarrays_by_target(dataarrays_by_target=dataarrays_by_target)
 
 
+@pytest.mark.slow
+def test_danra_example(request, tmp_path):
+    fp_config = Path(__file__).parent.parent / "example.danra.yaml"
+    if not request.config.getoption("--mdp-cache"):
+        mdp.create_dataset_zarr(
+            fp_config=fp_config, fp_zarr=tmp_path / "example.danra.zarr"
+        )
+        return
+
+    # key the cache on both the config and the source code of mllam-data-prep,
+    # so that any change to the package causes the dataset to be recreated
+    sha = hashlib.sha1(fp_config.read_bytes())
+    fp_package = Path(mdp.__file__).parent
+    for fp_source in sorted(fp_package.rglob("*.py")):
+        sha.update(str(fp_source.relative_to(fp_package)).encode())
+        sha.update(fp_source.read_bytes())
+    key = sha.hexdigest()[:12]
+    fp_zarr = Path(tempfile.gettempdir()) / "mdp_cache" / key / "example.danra.zarr"
+    # the consolidated metadata is written last, so only a dataset that was
+    # completely written will have it
+    if not (fp_zarr / ".zmetadata").exists():
+        mdp.create_dataset_zarr(fp_config=fp_config, fp_zarr=fp_zarr)
+    xr.open_zarr(fp_zarr)
+
+
+@pytest.mark.e2e
 @pytest.mark.parametrize("extra_content", [None, {"foobar": {"baz": 42}}])
-def test_optional_extra_section(extra_content):
+def test_optional_extra_section(datasets, extra_content):
     """
     Test to ensure that the optional `extra` section of the config can contain
     arbitrary information and is not required for the config to be valid
     """
-    tmpdir = tempfile.TemporaryDirectory()
-    datasets = testdata.create_data_collection(
-        data_kinds=["static"], fp_root=tmpdir.name
+    config_dict = _make_config(
+        inputs=dict(
+            danra_static=_make_input_config(
+                _BASE_INPUT_STATIC,
+                path=datasets["static"],
+                target_output_variable="static",
+                feature_dim="static_feature",
+            ),
+        ),
+        variables=dict(
+            static=["grid_index", "static_feature"],
+        ),
     )
 
-    config_dict = dict(
-        schema_version=testdata.SCHEMA_VERSION,
-        dataset_version="v0.1.0",
-        output=dict(
-            variables=dict(
-                static=["grid_index", "static_feature"],
+    if extra_content is not None:
+        config_dict["extra"] = extra_content
+
+    mdp.create_dataset(config=mdp.Config.from_dict(config_dict))
+
+
+@pytest.mark.e2e
+def test_config_from_file_like_object(datasets, tmp_path):
+    """
+    Check that the yaml config can be read from an open file-like object
+    rather than a path, so that it doesn't have to be written to disk first
+    """
+    config = _make_config(
+        inputs=dict(
+            danra_static=_make_input_config(
+                _BASE_INPUT_STATIC,
+                path=datasets["static"],
+                target_output_variable="static",
+                feature_dim="static_feature",
             ),
         ),
+        variables=dict(
+            static=["grid_index", "static_feature"],
+        ),
+    )
+
+    fp_config = io.BytesIO(
+        yaml.dump(_to_plain(config), Dumper=_YAML_DUMPER, encoding="utf-8")
+    )
+    mdp.create_dataset_zarr(fp_config=fp_config, fp_zarr=tmp_path / "out.zarr")
+
+
+@pytest.mark.e2e
+def test_config_from_yaml_file_default_output_path(datasets, tmp_path):
+    """
+    Check creating a dataset from a yaml config file path without giving the
+    output path (as is done by the command line interface), in which case the
+    dataset is written next to the config file with the `.yaml` extension
+    replaced by `.zarr`
+    """
+    config = _make_config(
         inputs=dict(
-            danra_static=dict(
+            danra_static=_make_input_config(
+                _BASE_INPUT_STATIC,
                 path=datasets["static"],
-                dims=["x", "y"],
-                variables=testdata.DEFAULT_STATIC_VARS,
-                dim_mapping=dict(
-                    grid_index=dict(
-                        method="stack",
-                        dims=["x", "y"],
-                    ),
-                    static_feature=dict(
-                        method="stack_variables_by_var_name",
-                        name_format="{var_name}",
-                    ),
-                ),
                 target_output_variable="static",
+                feature_dim="static_feature",
             ),
         ),
+        variables=dict(
+            static=["grid_index", "static_feature"],
+        ),
     )
 
-    if extra_content is not None:
-        config_dict["extra"] = extra_content
-
-    # write yaml config to file
-    fn_config = "config.yaml"
-    fp_config = Path(tmpdir.name) / fn_config
-    with open(fp_config, "w") as f:
-        yaml.dump(config_dict, f)
+    fp_config = tmp_path / "config.yaml"
+    with open(fp_config, "w") as fh:
+        yaml.dump(_to_plain(config), fh, Dumper=_YAML_DUMPER)
 
     mdp.create_dataset_zarr(fp_config=fp_config)
 
+    ds = xr.open_zarr(tmp_path / "config.zarr")
+    assert "static" in ds.data_vars
+
 
 CONFIG_REVISION_EXAMPLES_PATH = Path(__file__).parent / "old_config_schema_examples"
 
@@ -350,16 +418,18 @@ def find_config_revision_examples():
     return examples.values()
 
 
-@pytest.mark.parametrize("fp_example", find_config_revision_examples())
-def test_config_revision_examples(fp_example):
+_CONFIG_REVISION_EXAMPLES = tuple(find_config_revision_examples())
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize(
+    "fp_example",
+    _CONFIG_REVISION_EXAMPLES,
+    ids=[fp.parent.name for fp in _CONFIG_REVISION_EXAMPLES],
+)
+def test_config_revision_examples(fp_example, tmp_path):
     """
     Ensure that all the examples (which may be using different config schema
     versions)in the `config_examples` directory are valid
     """
-    tmpdir = tempfile.TemporaryDirectory()
-
-    # copy example to tempdir
-    fp_config_copy = Path(tmpdir.name) / fp_example.name
-    shutil.copy(fp_example, fp_config_copy)
-
-    mdp.create_dataset_zarr(fp_config=fp_config_copy)
+    mdp.create_dataset_zarr(fp_config=fp_example, fp_zarr=tmp_path / "out.zarr")
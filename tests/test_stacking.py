@@ -1,12 +1,36 @@
+import dask.array
 import numpy as np
+import pytest
 import xarray as xr
 
 from mllam_data_prep.config import DimMapping
 from mllam_data_prep.ops import mapping as mdp_mapping
 from mllam_data_prep.ops import stacking as mdp_stacking
 
+NX, NY, NZ = 10, 6, 3
+DIMS = ["x", "y", "level"]
+LEVELS = np.arange(NZ)
 
-def test_stack_variables_along_coord():
+
+@pytest.fixture(scope="module")
+def small_ds():
+    """
+    Dataset with two variables `var1` and `var2` on (x, y, level), shared
+    between the tests in this module (which mustn't modify it)
+    """
+    # every value is distinct (also between the two variables), so that any
+    # mix-up in the stacking order shows up when comparing values
+    data = np.arange(2 * NX * NY * NZ, dtype=np.float32).reshape((2, NX, NY, NZ))
+    return xr.Dataset(
+        {
+            "var1": xr.DataArray(data[0], dims=DIMS),
+            "var2": xr.DataArray(data[1], dims=DIMS),
+        },
+        coords={"level": LEVELS},
+    )
+
+
+def test_stack_variables_along_coord(small_ds):
     """
     Test the stacking of variables along a coordinate
 
@@ -14,15 +38,7 @@ def test_stack_variables_along_coord():
     to a single variable with levels [var1_l1, var1_l2, var1_l3, var2_l1, var2_l2, var2_l3]
     """
     name_format = "{var_name}_l{level}"
-    nx, ny, nz = 10, 6, 3
-    dims = ["x", "y", "level"]
-    ds = xr.Dataset(
-        {
-            "var1": xr.DataArray(np.random.random((nx, ny, nz)), dims=dims),
-            "var2": xr.DataArray(np.random.random((nx, ny, nz)), dims=dims),
-        },
-        coords={"level": np.arange(nz)},
-    )
+    ds = small_ds
 
     combined_dim_name = "feature"
     da_stacked = mdp_stacking.stack_variables_by_coord_values(
@@ -34,39 +50,104 @@ def test_stack_variables_along_coord():
     expected_coord_values = [
         name_format.format(var_name=v, level=level)
         for v in ["var1", "var2"]
-        for level in range(nz)
+        for level in LEVELS
     ]
 
-    assert da_stacked.dims == ("x", "y", "feature")
-    assert da_stacked.coords[combined_dim_name].values.tolist() == expected_coord_values
-    for v in expected_coord_values:
-        assert da_stacked.sel({combined_dim_name: v}).shape == (nx, ny)
+    # the levels of each variable follow each other along the stacked
+    # dimension, and the variables have no units or long_name attributes
+    da_expected = xr.DataArray(
+        np.concatenate([ds.var1.values, ds.var2.values], axis=-1),
+        dims=("x", "y", combined_dim_name),
+        coords={
+            combined_dim_name: expected_coord_values,
+            f"{combined_dim_name}_units": (combined_dim_name, [""] * 2 * NZ),
+            f"{combined_dim_name}_long_name": (combined_dim_name, [""] * 2 * NZ),
+        },
+    )
+    xr.testing.assert_equal(da_stacked, da_expected)
+
+
+def test_stack_variables_along_coord_dask(small_ds):
+    """
+    Test that stacking dask-backed variables (as is the case for datasets
+    opened with `xr.open_zarr`) doesn't load the data, and gives the same
+    result as stacking numpy-backed variables
+    """
+    kwargs = dict(
+        coord="level", name_format="{var_name}_l{level}", combined_dim_name="feature"
+    )
+    da_stacked = mdp_stacking.stack_variables_by_coord_values(
+        ds=small_ds.chunk({"x": 5}), **kwargs
+    )
 
-    # check that the values are the same
-    for v in ["var1", "var2"]:
-        for level in [1, 2]:
-            expected_values = ds[v].sel(level=level).values
-            actual_values = da_stacked.sel(
-                {combined_dim_name: name_format.format(var_name=v, level=level)}
-            ).values
-            assert np.all(expected_values == actual_values)
+    assert isinstance(da_stacked.data, dask.array.Array)
+    xr.testing.assert_identical(
+        da_stacked.compute(),
+        mdp_stacking.stack_variables_by_coord_values(ds=small_ds, **kwargs),
+    )
 
 
-def test_stack_xy_coords():
+def test_stack_variables_along_coord_with_aux_coord(small_ds):
     """
-    Test stacking two (or more) coordinates to create a single coordinate, for
-    example (x, y) grid coordinates to a single grid_index coordinate
+    Test that auxiliary coordinates along the stacked coordinate (e.g. the
+    height of each level) are repeated for each variable along the new
+    dimension
     """
-    nx, ny, nz = 10, 6, 3
-    dims = ["x", "y", "level"]
+    level_height = 100.0 * LEVELS
+    ds = small_ds.assign_coords(level_height=("level", level_height, {"units": "m"}))
 
-    ds = xr.Dataset(
-        {
-            "var1": xr.DataArray(np.random.random((nx, ny, nz)), dims=dims),
-            "var2": xr.DataArray(np.random.random((nx, ny, nz)), dims=dims),
+    da_stacked = mdp_stacking.stack_variables_by_coord_values(
+        ds=ds,
+        coord="level",
+        name_format="{var_name}_l{level}",
+        combined_dim_name="feature",
+    )
+
+    assert da_stacked.coords["level_height"].dims == ("feature",)
+    np.testing.assert_array_equal(
+        da_stacked.coords["level_height"].values,
+        np.concatenate([level_height, level_height]),
+    )
+    assert da_stacked.coords["level_height"].attrs == {"units": "m"}
+
+
+def test_stack_single_variable_along_coord(small_ds):
+    """
+    Test that stacking a single variable along a coordinate only replaces the
+    coordinate values, and that auxiliary coordinates along the stacked
+    coordinate are kept along the new dimension
+    """
+    name_format = "{var_name}_l{level}"
+    level_height = 100.0 * LEVELS
+    ds = small_ds[["var1"]].assign_coords(level_height=("level", level_height))
+    da_stacked = mdp_stacking.stack_variables_by_coord_values(
+        ds=ds,
+        coord="level",
+        name_format=name_format,
+        combined_dim_name="feature",
+    )
+
+    da_expected = xr.DataArray(
+        small_ds.var1.values,
+        dims=("x", "y", "feature"),
+        coords={
+            "feature": [
+                name_format.format(var_name="var1", level=lvl) for lvl in LEVELS
+            ],
+            "feature_units": ("feature", [""] * NZ),
+            "feature_long_name": ("feature", [""] * NZ),
+            "level_height": ("feature", level_height),
         },
-        coords={"level": np.arange(nz)},
     )
+    xr.testing.assert_equal(da_stacked, da_expected)
+
+
+def test_stack_xy_coords(small_ds):
+    """
+    Test stacking two (or more) coordinates to create a single coordinate, for
+    example (x, y) grid coordinates to a single grid_index coordinate
+    """
+    ds = small_ds
     dim_mapping = dict(
         grid_index=DimMapping(
             method="stack",
@@ -80,8 +161,8 @@ def test_stack_xy_coords():
     )
 
     da_stacked = mdp_mapping.map_dims_and_variables(
-        ds=ds, dim_mapping=dim_mapping, expected_input_var_dims=dims
+        ds=ds, dim_mapping=dim_mapping, expected_input_var_dims=DIMS
     )
 
     assert set(da_stacked.dims) == set(("grid_index", "feature"))
-    assert da_stacked.coords["grid_index"].shape == (nx * ny,)
+    assert da_stacked.coords["grid_index"].shape == (NX * NY,)